@@ -19,6 +19,12 @@ login_manager.login_message_category = 'info'
 from flask_blog.users.routes import users  # noqa
 from flask_blog.posts.routes import posts  # noqa
 from flask_blog.main.routes import main  # noqa
+from flask_blog.feeds.routes import feeds  # noqa
+
+# import the cli commands
+from flask_blog.users.recommend import recommend_command  # noqa
+from flask_blog.audit import db_audit_command  # noqa
+from flask_blog.users.bloom import start_refresher  # noqa
 
 
 def create_app(config_class=Config):
@@ -34,5 +40,12 @@ def create_app(config_class=Config):
     app.register_blueprint(users)
     app.register_blueprint(posts)
     app.register_blueprint(main)
+    app.register_blueprint(feeds)
+
+    app.cli.add_command(recommend_command)
+    app.cli.add_command(db_audit_command)
+
+    # username/email availability filters, built off the request path
+    start_refresher(app)
 
     return app
@@ -0,0 +1,311 @@
+import os
+import re
+import secrets
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+
+import click
+from alembic.config import Config as AlembicConfig
+from alembic.script import ScriptDirectory
+from flask import current_app, url_for
+from flask.cli import with_appcontext
+from sqlalchemy import event, inspect
+
+from flask_blog import db
+from flask_blog.models import Post, User
+
+# plan lines worth a second look, per dialect.
+# a table scan names the table in group 1
+SCAN_PATTERNS = {
+    'sqlite': re.compile(r'^SCAN (?:TABLE )?(\w+)(?: AS \w+)?$'),
+    'postgresql': re.compile(r'Seq Scan on (\w+)'),
+}
+SORT_PATTERNS = {
+    'sqlite': re.compile(r'USE TEMP B-TREE FOR (?:RIGHT PART OF )?(?:ORDER BY|GROUP BY|DISTINCT)'),
+    'postgresql': re.compile(r'^\s*(?:->\s*)?Sort\b'),
+}
+EXPLAIN_PREFIX = {
+    'sqlite': 'EXPLAIN QUERY PLAN ',
+    'postgresql': 'EXPLAIN ',
+}
+
+# table.column compared against a bound parameter or literal, on either side.
+# join conditions (table.column = table.column) are left out, the joined
+# table is usually reached through its primary key
+VALUE = r"(?:\?|%\(\w+\)s|:\w+|\d+|'[^']*')"
+FILTER_COLUMNS = (re.compile(r'(\w+)\.(\w+)\s*(?:=|!=|<=|>=|<|>|\bIN\b|\bLIKE\b)\s*\(?' + VALUE),
+                  re.compile(VALUE + r'\s*(?:=|!=|<=|>=|<|>)\s*(\w+)\.(\w+)'))
+# GROUP BY / ORDER BY clauses, an index in that column order saves the sort
+SORT_BY = re.compile(r'\b(?:GROUP|ORDER) BY (.+?)(?=\bHAVING\b|\bORDER BY\b|\bLIMIT\b|\bOFFSET\b|\)|$)', re.S)
+ALIAS = re.compile(r'\b(?:FROM|JOIN|,)\s+(\w+) AS (\w+)')
+
+MIGRATION_TEMPLATE = '''"""{message}
+
+Revision ID: {revision}
+Revises: {down_revision}
+Create Date: {create_date}
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '{revision}'
+down_revision = {down_revision!r}
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # ### commands suggested by flask db-audit - please adjust! ###
+{upgrade}
+    # ### end commands ###
+
+
+def downgrade():
+    # ### commands suggested by flask db-audit - please adjust! ###
+{downgrade}
+    # ### end commands ###
+'''
+
+
+@contextmanager
+def rolled_back_session():
+    # every route runs inside one outer transaction that is thrown away at
+    # the end, so the commits made by the scripted posts never land
+    connection = db.engine.connect()
+    outer = connection.begin()
+    session = db.session
+    db.session = db.create_scoped_session(options={'bind': connection, 'binds': {}})
+    try:
+        yield connection
+    finally:
+        db.session.remove()
+        db.session = session
+        outer.rollback()
+        connection.close()
+
+
+@contextmanager
+def audit_mode(app):
+    # let the test client log in and submit forms without sending any mail
+    saved = {key: app.config.get(key) for key in ('SECRET_KEY', 'WTF_CSRF_ENABLED')}
+    mail_state = app.extensions.get('mail')
+    suppress = getattr(mail_state, 'suppress', None)
+    app.config['SECRET_KEY'] = saved['SECRET_KEY'] or secrets.token_hex(16)
+    app.config['WTF_CSRF_ENABLED'] = False
+    if mail_state is not None:
+        mail_state.suppress = True
+    try:
+        yield
+    finally:
+        app.config.update(saved)
+        if mail_state is not None:
+            mail_state.suppress = suppress
+
+
+def sample_args():
+    post = Post.query.first()
+    if post is None:
+        raise click.ClickException('db-audit needs at least one post to exercise the routes.')
+    user = post.author
+    other = User.query.filter(User.id != user.id).first() or user
+    args = {
+        'post_id': post.id,
+        'username': user.username,
+        'token': user.get_reset_token(),
+        'fmt': 'atom',
+        'kind': 'posts',
+        'shard': post.id // current_app.config['SITEMAP_SHARD_SIZE'],
+    }
+    return user, other, post, args
+
+
+def scripted_requests(user, other, post, args):
+    # (method, logged in, endpoint, url values, form data)
+    app = current_app._get_current_object()
+    for rule in sorted(app.url_map.iter_rules(), key=lambda r: r.endpoint):
+        if rule.endpoint == 'static' or 'GET' not in rule.methods:
+            continue
+        if not rule.arguments <= set(args):
+            click.echo(f'skipping {rule.endpoint}: no sample value for {rule.arguments - set(args)}')
+            continue
+        values = {name: args[name] for name in rule.arguments}
+        yield 'GET', False, rule.endpoint, values, None
+        yield 'GET', True, rule.endpoint, values, None
+
+    password = {'password': 'not-the-password', 'confirm_password': 'not-the-password'}
+    post_data = {'title': 'db-audit', 'content': 'db-audit'}
+    yield 'POST', False, 'users.login_page', {}, {'username': user.username, **password}
+    yield 'POST', False, 'users.register_page', {}, {'username': user.username, 'email': user.email, **password}
+    yield 'POST', False, 'users.reset_request', {}, {'email': user.email}
+    yield 'POST', True, 'users.account', {}, {'username': user.username, 'email': user.email}
+    yield 'POST', True, 'users.follow', {'username': other.username}, {}
+    yield 'POST', True, 'users.unfollow', {'username': other.username}, {}
+    yield 'POST', True, 'posts.new_post', {}, post_data
+    yield 'POST', True, 'posts.update_post', {'post_id': post.id}, post_data
+    yield 'POST', True, 'posts.delete_post', {'post_id': post.id}, {}
+
+
+def capture(connection):
+    # run the script and collect every distinct statement with the routes
+    # that emitted it and one set of parameters to explain it with
+    statements = OrderedDict()
+    label = [None]
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if executemany:
+            parameters = parameters[0]
+        entry = statements.setdefault(statement, {'parameters': parameters, 'routes': set()})
+        entry['routes'].add(label[0])
+
+    user, other, post, args = sample_args()
+    app = current_app._get_current_object()
+    client = app.test_client()
+    event.listen(connection, 'before_cursor_execute', record)
+    try:
+        for method, logged_in, endpoint, values, data in scripted_requests(user, other, post, args):
+            with app.test_request_context():
+                url = url_for(endpoint, **values)
+            label[0] = f'{method} {endpoint}'
+            with client.session_transaction() as session:
+                session.clear()
+                if logged_in:
+                    session['_user_id'] = str(user.id)
+                    session['_fresh'] = True
+            client.open(url, method=method, data=data)
+    finally:
+        event.remove(connection, 'before_cursor_execute', record)
+    return statements
+
+
+def explain(connection, statement, parameters):
+    dialect = connection.dialect.name
+    rows = connection.exec_driver_sql(EXPLAIN_PREFIX[dialect] + statement, parameters).fetchall()
+    if dialect == 'sqlite':
+        return [row[-1] for row in rows]
+    return [row[0] for row in rows]
+
+
+def columns_by_table(statement):
+    # table -> columns used in comparisons, and in GROUP BY / ORDER BY, with any
+    # "AS alias" mapped back onto the real table name
+    sql = statement.replace('"', '').replace('`', '')
+    aliases = {alias: table for table, alias in ALIAS.findall(sql)}
+    filters, order = {}, {}
+    matches = sorted((m for pattern in FILTER_COLUMNS for m in pattern.finditer(sql)),
+                     key=lambda m: m.start())
+    for match in matches:
+        table, column = match.groups()
+        table = aliases.get(table, table)
+        filters.setdefault(table, [])
+        if column not in filters[table]:
+            filters[table].append(column)
+    for clause in SORT_BY.findall(sql):
+        for table, column in re.findall(r'(\w+)\.(\w+)', clause):
+            columns = order.setdefault(aliases.get(table, table), [])
+            if column not in columns:
+                columns.append(column)
+    return aliases, filters, order
+
+
+def existing_indexes(connection):
+    inspector = inspect(connection)
+    indexes = {}
+    for table in inspector.get_table_names():
+        found = [tuple(ix['column_names']) for ix in inspector.get_indexes(table)]
+        found += [tuple(uc['column_names']) for uc in inspector.get_unique_constraints(table)]
+        pk = inspector.get_pk_constraint(table).get('constrained_columns')
+        if pk:
+            found.append(tuple(pk))
+        indexes[table] = found
+    return indexes
+
+
+def audit(connection, statements):
+    dialect = connection.dialect.name
+    if dialect not in EXPLAIN_PREFIX:
+        raise click.ClickException(f'db-audit does not know how to explain queries on {dialect}.')
+    scan, sort = SCAN_PATTERNS[dialect], SORT_PATTERNS[dialect]
+    indexes = existing_indexes(connection)
+    findings, suggestions = [], OrderedDict()
+
+    for statement, entry in statements.items():
+        plan = explain(connection, statement, entry['parameters'])
+        scanned = [m.group(1) for m in map(scan.search, plan) if m]
+        sorted_ = any(sort.search(line) for line in plan)
+        if not scanned and not sorted_:
+            continue
+        aliases, filters, order = columns_by_table(statement)
+        scanned = [aliases.get(table, table) for table in scanned]
+        findings.append((statement, entry['routes'], plan))
+
+        for table in scanned or order:
+            columns = list(filters.get(table, []))
+            if sorted_:
+                columns += [c for c in order.get(table, []) if c not in columns]
+            if not columns:
+                continue
+            candidate = tuple(columns)
+            if any(ix[:len(candidate)] == candidate for ix in indexes.get(table, [])):
+                continue
+            suggestions[(table, candidate)] = True
+
+    # an index on (a, b) also serves lookups on a alone
+    keep = [(table, cols) for table, cols in suggestions
+            if not any(other != cols and t == table and other[:len(cols)] == cols
+                       for t, other in suggestions)]
+    return findings, keep
+
+
+def index_name(table, columns):
+    return f"ix_{table}_{'_'.join(columns)}"
+
+
+def migration(indexes):
+    config = AlembicConfig()
+    config.set_main_option('script_location', current_app.extensions['migrate'].directory)
+    down_revision = ScriptDirectory.from_config(config).get_current_head()
+    upgrade = '\n'.join(
+        f"    op.create_index(op.f('{index_name(table, cols)}'), '{table}', {list(cols)!r}, unique=False)"
+        for table, cols in indexes)
+    downgrade = '\n'.join(
+        f"    op.drop_index(op.f('{index_name(table, cols)}'), table_name='{table}')"
+        for table, cols in reversed(indexes))
+    return MIGRATION_TEMPLATE.format(message='indexes suggested by db-audit',
+                                     revision=uuid.uuid4().hex[-12:],
+                                     down_revision=down_revision,
+                                     create_date=datetime.now(),
+                                     upgrade=upgrade, downgrade=downgrade)
+
+
+@click.command('db-audit')
+@click.option('--output', type=click.Path(dir_okay=False, writable=True),
+              help='Write the suggested migration here instead of printing it.')
+@with_appcontext
+def db_audit_command(output):
+    """Explain the SQL emitted by every route and suggest missing indexes."""
+    app = current_app._get_current_object()
+    with audit_mode(app), rolled_back_session() as connection:
+        statements = capture(connection)
+        findings, indexes = audit(connection, statements)
+
+    click.echo(f'{len(statements)} distinct statements captured, {len(findings)} flagged\n')
+    for statement, routes, plan in findings:
+        click.echo(', '.join(sorted(routes)))
+        click.echo('    ' + ' '.join(statement.split()))
+        for line in plan:
+            click.echo('    | ' + line)
+        click.echo()
+
+    if not indexes:
+        click.echo('No missing indexes found.')
+        return
+    script = migration(indexes)
+    if output:
+        with open(output, 'w') as f:
+            f.write(script)
+        click.echo(f'Suggested migration written to {os.path.abspath(output)}')
+    else:
+        click.echo(script)
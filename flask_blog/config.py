@@ -12,3 +12,14 @@ class Config(object):
     MAIL_USE_TLS = True
     MAIL_USERNAME = os.environ.get('MY_EMAIL')
     MAIL_PASSWORD = os.environ.get('EMAIL_PW')
+    SUGGESTIONS_PER_USER = 5
+    RECOMMEND_BATCH_SIZE = 1024
+    RECOMMEND_MAX_FANOUT = 50
+    # scheme and host for absolute links in feeds and sitemaps, e.g. https://blog.example.com
+    FEED_BASE_URL = os.environ.get('FEED_BASE_URL')
+    FEED_LENGTH = 20
+    FEED_CACHE_TIMEOUT = 300
+    SITEMAP_SHARD_SIZE = 10000
+    BLOOM_ERROR_RATE = 0.01
+    BLOOM_MIN_CAPACITY = 1024
+    BLOOM_REBUILD_INTERVAL = 600
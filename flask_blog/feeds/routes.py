@@ -0,0 +1,26 @@
+from flask import Blueprint
+
+from flask_blog.feeds import utils
+
+feeds = Blueprint('feeds', __name__)
+
+
+# site wide feed (something.domain/feed.atom; something.domain/feed.rss)
+@feeds.route("/feed.<any(atom, rss):fmt>")
+def site_feed(fmt):
+    return utils.feed(fmt)
+
+
+@feeds.route("/user/<string:username>/feed.<any(atom, rss):fmt>")
+def user_feed(username, fmt):
+    return utils.feed(fmt, username)
+
+
+@feeds.route("/sitemap.xml")
+def sitemap():
+    return utils.sitemap_index()
+
+
+@feeds.route("/sitemap-<any(posts, users):kind>-<int:shard>.xml")
+def sitemap_shard(kind, shard):
+    return utils.sitemap_shard(kind, shard)
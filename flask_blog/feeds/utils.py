@@ -0,0 +1,144 @@
+import hashlib
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+
+from flask import abort, current_app, make_response, render_template, request
+from sqlalchemy import desc, func
+
+from flask_blog import db
+from flask_blog.models import Post, User
+
+FEED_FORMATS = {
+    'atom': ('feeds/atom.xml', 'application/atom+xml'),
+    'rss': ('feeds/rss.xml', 'application/rss+xml'),
+}
+
+CacheEntry = namedtuple('CacheEntry', 'body mimetype etag last_modified expires')
+
+# rendered feeds and sitemaps, keyed by base url and what they cover, e.g.
+# ('feed', None, 'atom') for the site feed or ('sitemap', 'posts', 3) for a shard.
+# entries go stale when a post they cover changes, and expire after
+# FEED_CACHE_TIMEOUT so other worker processes eventually catch up too.
+# last_modified is when the body last actually changed, never taken from the
+# posts: edits keep date_posted and deletes would move it backwards
+_cache = {}
+
+
+def base_url():
+    # absolute links must not follow the Host header, or whoever triggers a
+    # rebuild picks the host every crawler gets. set FEED_BASE_URL (or
+    # SERVER_NAME); without either the request host is used, and cached
+    # documents are kept apart per host
+    config = current_app.config
+    if config['FEED_BASE_URL']:
+        return config['FEED_BASE_URL'].rstrip('/')
+    if config['SERVER_NAME']:
+        return f"{config['PREFERRED_URL_SCHEME']}://{config['SERVER_NAME']}"
+    return request.host_url.rstrip('/')
+
+
+def cached_response(key, build, mimetype):
+    base = base_url()
+    key = (base,) + key
+    entry = _cache.get(key)
+    if entry is None or entry.expires < time.time():
+        body = build(base).encode('utf-8')
+        etag = hashlib.sha1(body).hexdigest()
+        if entry is not None and entry.etag == etag:
+            last_modified = entry.last_modified
+        else:
+            last_modified = datetime.now(timezone.utc).replace(microsecond=0)
+            if entry is not None:
+                # http dates only have whole seconds, always move forward
+                last_modified = max(last_modified, entry.last_modified + timedelta(seconds=1))
+        entry = CacheEntry(body, mimetype, etag, last_modified,
+                           time.time() + current_app.config['FEED_CACHE_TIMEOUT'])
+        _cache[key] = entry
+    response = make_response(entry.body)
+    response.mimetype = entry.mimetype
+    response.set_etag(entry.etag)
+    response.last_modified = entry.last_modified
+    response.cache_control.public = True
+    response.cache_control.max_age = current_app.config['FEED_CACHE_TIMEOUT']
+    return response.make_conditional(request)
+
+
+def invalidate(*keys):
+    # expire rather than drop, the next build needs the old etag and date
+    keys = set(keys)
+    for key, entry in list(_cache.items()):
+        if key[1:] in keys:
+            _cache[key] = entry._replace(expires=0)
+
+
+def feed_keys(username):
+    return [('feed', username, fmt) for fmt in FEED_FORMATS]
+
+
+def shard_of(item_id):
+    return item_id // current_app.config['SITEMAP_SHARD_SIZE']
+
+
+# everything a post shows up in: the site feed, its author's feed,
+# its sitemap shard and the sitemap index listing that shard
+def post_keys(post):
+    return feed_keys(None) + feed_keys(post.author.username) + [
+        ('sitemap', 'posts', shard_of(post.id)),
+        ('sitemap', 'index'),
+    ]
+
+
+def user_keys(user):
+    return feed_keys(user.username) + [
+        ('sitemap', 'users', shard_of(user.id)),
+        ('sitemap', 'index'),
+    ]
+
+
+def feed(fmt, username=None):
+    template, mimetype = FEED_FORMATS[fmt]
+
+    def build(base):
+        query = Post.query.order_by(desc(Post.date_posted))
+        user = None
+        if username is not None:
+            user = User.query.filter_by(username=username).first_or_404()
+            query = query.filter_by(author=user)
+        posts = query.limit(current_app.config['FEED_LENGTH']).all()
+        updated = posts[0].date_posted if posts else None
+        return render_template(template, base=base, posts=posts, user=user,
+                               updated=updated)
+
+    return cached_response(('feed', username, fmt), build, mimetype)
+
+
+def sitemap_index():
+    def build(base):
+        size = current_app.config['SITEMAP_SHARD_SIZE']
+        post_shards = db.session.query((Post.id / size).label('shard'),
+                                       func.max(Post.date_posted)) \
+            .group_by('shard').order_by('shard').all()
+        user_shards = db.session.query((User.id / size).label('shard')) \
+            .group_by('shard').order_by('shard').all()
+        return render_template('feeds/sitemap_index.xml', base=base,
+                               post_shards=post_shards,
+                               user_shards=user_shards)
+
+    return cached_response(('sitemap', 'index'), build, 'application/xml')
+
+
+def sitemap_shard(kind, shard):
+    model = Post if kind == 'posts' else User
+
+    def build(base):
+        size = current_app.config['SITEMAP_SHARD_SIZE']
+        items = model.query \
+            .filter(model.id >= shard * size, model.id < (shard + 1) * size) \
+            .order_by(model.id).all()
+        if not items:
+            abort(404)
+        return render_template('feeds/sitemap.xml', base=base, kind=kind,
+                               items=items)
+
+    return cached_response(('sitemap', kind, shard), build, 'application/xml')
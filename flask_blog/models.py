@@ -75,6 +75,13 @@ class User(db.Model, UserMixin):
         return self.followed.filter(
             followers.c.followed_id == user.id).count() > 0
 
+    def suggested(self, limit):
+        return User.query \
+            .join(Suggestion, Suggestion.suggested_id == User.id) \
+            .filter(Suggestion.user_id == self.id) \
+            .order_by(Suggestion.score.desc()) \
+            .limit(limit).all()
+
 
 # create new Model (table/entity) called Posts
 class Post(db.Model):
@@ -94,6 +101,16 @@ class Post(db.Model):
     def __repr__(self):
         return f"Post({self.title}, {self.author})"
 
+
+# precomputed "who to follow" rows, rebuilt offline by `flask recommend`
+class Suggestion(db.Model):
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    suggested_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    score = db.Column(db.Float, nullable=False)
+
+    def __repr__(self):
+        return f"Suggestion({self.user_id}, {self.suggested_id}, {self.score})"
+
 # -------------------------------------------------------------------------------------------
 # when you have finished making User and Post, IN YOUR VIRTUAL ENVIRONMENT TERMINAL
 # >>> python
@@ -3,6 +3,7 @@ from flask import abort, Blueprint, flash, render_template, url_for, \
 from flask_login import current_user, login_required
 
 from flask_blog import db
+from flask_blog.feeds.utils import invalidate, post_keys
 from flask_blog.models import Post
 from flask_blog.posts.forms import PostForm
 
@@ -21,6 +22,7 @@ def new_post():
         db.session.add(this_post)
         # commit change to db
         db.session.commit()
+        invalidate(*post_keys(this_post))
         flash('Post Created', 'success')
         return redirect(url_for('main.home_page'))
     return render_template('create_post.html', title='New Post',
@@ -44,6 +46,7 @@ def update_post(post_id):
         this_post.title = form.title.data
         this_post.content = form.content.data
         db.session.commit()
+        invalidate(*post_keys(this_post))
         flash('Your post has been update!', 'success')
         return redirect(url_for('posts.post', post_id=this_post.id))
     elif request.method == 'GET':
@@ -59,7 +62,10 @@ def delete_post(post_id):
     this_post = Post.query.get_or_404(post_id)
     if this_post.author != current_user:
         abort(403)
+    # work out the stale feeds while the post is still loaded
+    stale = post_keys(this_post)
     db.session.delete(this_post)
     db.session.commit()
+    invalidate(*stale)
     flash('Your post has been deleted.', 'danger')
     return redirect(url_for('main.home_page'))
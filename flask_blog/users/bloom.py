@@ -0,0 +1,121 @@
+import hashlib
+import math
+import threading
+
+from flask import current_app
+
+from flask_blog import db
+from flask_blog.models import User
+
+FIELDS = ('username', 'email')
+
+
+class BloomFilter(object):
+    # a set that can answer "definitely not in here" from a fixed amount of
+    # memory, at the cost of the odd false "maybe" (about error_rate of them)
+    def __init__(self, capacity, error_rate=0.01):
+        self.capacity = max(capacity, 1)
+        self.size = int(-self.capacity * math.log(error_rate) / math.log(2) ** 2) + 1
+        self.hashes = max(int(round(self.size / self.capacity * math.log(2))), 1)
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, value):
+        # double hashing: k positions from the two halves of one digest
+        digest = hashlib.blake2b(value.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, value):
+        # values already in (or colliding with) the filter set no new bits,
+        # counting them would only bring the next rebuild forward
+        if value in self:
+            return
+        for pos in self._positions(value):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, value):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7))
+                   for pos in self._positions(value))
+
+
+# one filter per unique User column. a background thread builds them when the
+# app starts, and rebuilds them every BLOOM_REBUILD_INTERVAL seconds (sooner
+# once one fills past capacity) so that this worker picks up names registered
+# by other workers. requests never wait on that: until the first build is in
+# every check goes to the db, and values marked while a rebuild is reading the
+# table are replayed into the new filters before they are swapped in.
+# values that are given up (account changes) stay in the filter, they only
+# cost a db lookup.
+_filters = {}
+_pending = None
+_lock = threading.Lock()
+_wake = threading.Event()
+_refresher = None
+
+
+def _rebuild():
+    global _pending
+    with _lock:
+        _pending = []
+    try:
+        rows = db.session.query(User.username, User.email).all()
+        capacity = max(len(rows) * 2, current_app.config['BLOOM_MIN_CAPACITY'])
+        error_rate = current_app.config['BLOOM_ERROR_RATE']
+        filters = {field: BloomFilter(capacity, error_rate) for field in FIELDS}
+        for username, email in rows:
+            filters['username'].add(username)
+            filters['email'].add(email)
+        with _lock:
+            for field, value in _pending:
+                filters[field].add(value)
+            _filters.update(filters)
+    finally:
+        with _lock:
+            _pending = None
+
+
+def _refresh(app):
+    while True:
+        with app.app_context():
+            try:
+                _rebuild()
+            except Exception as e:  # noqa, e.g. the tables are not migrated yet
+                app.logger.warning('Could not build the username/email filters: %s', e)
+        _wake.wait(app.config['BLOOM_REBUILD_INTERVAL'])
+        _wake.clear()
+
+
+def start_refresher(app):
+    # one per process, started again in a forked worker whose copy is not running
+    global _refresher
+    with _lock:
+        if _refresher is None or not _refresher.is_alive():
+            _refresher = threading.Thread(target=_refresh, args=(app,),
+                                          name='bloom-refresher', daemon=True)
+            _refresher.start()
+
+
+def mark_taken(user):
+    start_refresher(current_app._get_current_object())
+    with _lock:
+        for field in FIELDS:
+            value = getattr(user, field)
+            if field in _filters:
+                _filters[field].add(value)
+                if _filters[field].count > _filters[field].capacity:
+                    _wake.set()
+            if _pending is not None:
+                _pending.append((field, value))
+
+
+def is_taken(field, value):
+    start_refresher(current_app._get_current_object())
+    bloom = _filters.get(field)
+    if bloom is not None and value not in bloom:
+        return False
+    # possible hit (or no filter yet), ask the unique index
+    return db.session.query(User.id) \
+        .filter(getattr(User, field) == value).first() is not None
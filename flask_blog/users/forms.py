@@ -7,6 +7,7 @@ from wtforms.validators import \
     DataRequired, Email, EqualTo, Length, ValidationError
 
 from flask_blog.models import User
+from flask_blog.users.bloom import is_taken
 
 
 class RegistrationForm(FlaskForm):
@@ -23,13 +24,11 @@ class RegistrationForm(FlaskForm):
     submit = SubmitField('Sign Up')
 
     def validate_username(self, username):  # noqa
-        user = User.query.filter_by(username=username.data).first()
-        if user:
+        if is_taken('username', username.data):
             raise ValidationError('Username taken, try another one.')
 
     def validate_email(self, email):  # noqa
-        user = User.query.filter_by(email=email.data).first()
-        if user:
+        if is_taken('email', email.data):
             raise ValidationError('An account with that email has already been registered.')
 
 
@@ -54,14 +53,12 @@ class UpdateAccountForm(FlaskForm):
 
     def validate_username(self, username):  # noqa
         if username.data != current_user.username:
-            user = User.query.filter_by(username=username.data).first()
-            if user:
+            if is_taken('username', username.data):
                 raise ValidationError('Username taken, try another one.')
 
     def validate_email(self, email):  # noqa
         if email.data != current_user.email:
-            user = User.query.filter_by(email=email.data).first()
-            if user:
+            if is_taken('email', email.data):
                 raise ValidationError('An account with that email has already been registered.')
 
 
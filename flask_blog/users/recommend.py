@@ -0,0 +1,142 @@
+import click
+import numpy as np
+from flask import current_app
+from flask.cli import with_appcontext
+
+from flask_blog import db
+from flask_blog.models import Suggestion, User, followers
+
+# co-follow paths are three hops long and far more numerous than
+# friend-of-friend paths, so they count for less
+CO_FOLLOW_WEIGHT = 0.5
+
+
+def load_graph():
+    # map user ids onto 0..n-1 so the graph can live in numpy arrays
+    user_ids = np.array([row.id for row in db.session.query(User.id)
+                        .order_by(User.id)], dtype=np.int64)
+    edges = np.array(db.session.query(followers.c.follower_id,
+                                      followers.c.followed_id).all(),
+                     dtype=np.int64).reshape(-1, 2)
+    src = np.searchsorted(user_ids, edges[:, 0])
+    dst = np.searchsorted(user_ids, edges[:, 1])
+    return user_ids, src, dst
+
+
+def to_csr(src, dst, n):
+    # compressed sparse rows: the neighbours of row i are
+    # indices[indptr[i]:indptr[i + 1]]
+    order = np.argsort(src, kind='stable')
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(src, minlength=n), out=indptr[1:])
+    return indptr, dst[order]
+
+
+def expand(rows, cols, weights, csr, n):
+    # one sparse matrix product step: every (row, col, weight) entry is
+    # pushed along the outgoing edges of col, then duplicates are summed
+    indptr, indices = csr
+    degree = indptr[cols + 1] - indptr[cols]
+    total = int(degree.sum())
+    if total == 0:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, np.empty(0)
+    starts = np.repeat(indptr[cols] - np.cumsum(degree) + degree, degree)
+    targets = indices[starts + np.arange(total)]
+    keys = np.repeat(rows, degree) * n + targets
+    keys, inverse = np.unique(keys, return_inverse=True)
+    summed = np.bincount(inverse, weights=np.repeat(weights, degree))
+    return keys // n, keys % n, summed
+
+
+def drop_hubs(rows, cols, weights, csr, limit):
+    # leave out entries whose col has more than `limit` edges in csr, a popular
+    # account says little about any one of its followers and is what blows up
+    indptr, _ = csr
+    keep = indptr[cols + 1] - indptr[cols] <= limit
+    return rows[keep], cols[keep], weights[keep]
+
+
+def pick_followees(rows, cols, weights, csr, limit):
+    # the `limit` followees of each row worth walking through csr: ones that
+    # lead somewhere, least connected first, since a niche account says more
+    # about taste than a popular one. hubs past `limit` edges are never picked
+    indptr, _ = csr
+    degree = indptr[cols + 1] - indptr[cols]
+    index = np.flatnonzero((degree > 0) & (degree <= limit))
+    _, index, _ = top_n(rows[index], index, -degree[index].astype(float), limit)
+    return rows[index], cols[index], weights[index]
+
+
+def score_batch(batch, forward, backward, n, fanout):
+    # friend-of-friend: A @ A, co-follow: A @ A.T @ A, for the batch rows only.
+    # per row at most `fanout` followees are walked (see pick_followees, chosen
+    # separately for each direction), only through nodes with at most `fanout`
+    # edges, and only the `fanout` most similar other users are expanded, so
+    # past the batch's own follow edges no step holds more than
+    # len(batch) * fanout ** 2 entries, however popular an account gets
+    rows = np.arange(len(batch))
+    ones = np.ones(len(batch))
+    hop_rows, hop_cols, hop_weights = expand(rows, batch, ones, forward, n)
+    hop = hop_rows, hop_cols, hop_weights
+    fof = expand(*pick_followees(*hop, forward, fanout), forward, n)
+    sim_rows, sim_cols, sim_weights = expand(*pick_followees(*hop, backward, fanout), backward, n)
+    # everybody shares all their followees with themselves
+    other = sim_cols != batch[sim_rows]
+    similar = top_n(sim_rows[other], sim_cols[other], sim_weights[other], fanout)
+    co = expand(*drop_hubs(*similar, forward, fanout), forward, n)
+
+    keys = np.concatenate([fof[0] * n + fof[1], co[0] * n + co[1]])
+    scores = np.concatenate([fof[2], co[2] * CO_FOLLOW_WEIGHT])
+    keys, inverse = np.unique(keys, return_inverse=True)
+    scores = np.bincount(inverse, weights=scores)
+    rows, cols = keys // n, keys % n
+
+    # never suggest yourself or somebody you already follow
+    already = np.isin(keys, hop_rows * n + hop_cols)
+    keep = (cols != batch[rows]) & ~already
+    return rows[keep], cols[keep], scores[keep]
+
+
+def top_n(rows, cols, scores, limit):
+    # sort by row, then best score first, and keep the first `limit` of each
+    order = np.lexsort((-scores, rows))
+    rows, cols, scores = rows[order], cols[order], scores[order]
+    firsts = np.searchsorted(rows, rows)
+    keep = np.arange(len(rows)) - firsts < limit
+    return rows[keep], cols[keep], scores[keep]
+
+
+def build_suggestions(limit=None, batch_size=None):
+    limit = limit or current_app.config['SUGGESTIONS_PER_USER']
+    batch_size = batch_size or current_app.config['RECOMMEND_BATCH_SIZE']
+    fanout = current_app.config['RECOMMEND_MAX_FANOUT']
+    user_ids, src, dst = load_graph()
+    n = len(user_ids)
+    forward = to_csr(src, dst, n)
+    backward = to_csr(dst, src, n)
+
+    Suggestion.query.delete()
+    written = 0
+    for start in range(0, n, batch_size):
+        batch = np.arange(start, min(start + batch_size, n))
+        rows, cols, scores = top_n(*score_batch(batch, forward, backward, n, fanout), limit)
+        db.session.bulk_insert_mappings(Suggestion, [
+            {'user_id': int(user_ids[batch[r]]),
+             'suggested_id': int(user_ids[c]),
+             'score': float(s)}
+            for r, c, s in zip(rows, cols, scores)
+        ])
+        written += len(rows)
+    db.session.commit()
+    return written
+
+
+@click.command('recommend')
+@click.option('--limit', type=int, help='Suggestions to keep per user.')
+@click.option('--batch-size', type=int, help='Users scored per batch.')
+@with_appcontext
+def recommend_command(limit, batch_size):
+    """Rebuild the "who to follow" suggestion table."""
+    written = build_suggestions(limit, batch_size)
+    click.echo(f'{written} suggestions written')
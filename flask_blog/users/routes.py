@@ -1,11 +1,14 @@
 from flask import \
-    Blueprint, flash, redirect, render_template, request, url_for
+    Blueprint, current_app, flash, jsonify, redirect, render_template, request, url_for
 from flask_login import \
     current_user, login_required, login_user, logout_user
 from sqlalchemy import desc
+from sqlalchemy.exc import IntegrityError
 
 from flask_blog import db, bcrypt
-from flask_blog.models import User, Post
+from flask_blog.feeds.utils import feed_keys, invalidate, user_keys
+from flask_blog.models import Post, Suggestion, User
+from flask_blog.users.bloom import FIELDS, is_taken, mark_taken
 from flask_blog.users.forms import \
     LoginForm, RegistrationForm, ResetPasswordForm, \
     RequestResetForm, UpdateAccountForm
@@ -27,12 +30,28 @@ def register_page():
         user.email = form.email.data
         user.password = hashed
         db.session.add(user)
-        db.session.commit()
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # registered by another worker since our filter was last rebuilt
+            db.session.rollback()
+            flash('That username or email has just been taken, try another one.', 'danger')
+            return render_template('register.html', title='Register', form=form)
+        mark_taken(user)
+        invalidate(*user_keys(user))
         flash(f'Your account has been created you can now log in!', 'success')
         return redirect(url_for('main.home_page'))
     return render_template('register.html', title='Register', form=form)
 
 
+# live availability check used by the register page
+# (something.domain/register/available?username=...&email=...)
+@users.route("/register/available")
+def availability():
+    return jsonify({field: not is_taken(field, request.args[field])
+                    for field in FIELDS if request.args.get(field)})
+
+
 # login page (something.domain/login)
 @users.route("/login", methods=["get", "post"])
 def login_page():
@@ -66,16 +85,29 @@ def account():
         if form.picture.data:
             pic_file = save_picture(form.picture.data)
             current_user.image_file = pic_file
+        # feeds and sitemaps are addressed by username, drop the old ones
+        stale = user_keys(current_user)
+        if form.username.data != current_user.username:
+            # the site feed names the author of each entry too
+            stale += feed_keys(None)
         current_user.username = form.username.data
         current_user.email = form.email.data
-        db.session.commit()
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            flash('That username or email has just been taken, try another one.', 'danger')
+            return redirect(url_for('users.account'))
+        mark_taken(current_user)
+        invalidate(*stale)
         flash('Your account has been updated', 'success')
         return redirect(url_for('users.account'))
     elif request.method == 'GET':
         form.username.data = current_user.username
         form.email.data = current_user.email
+    suggestions = current_user.suggested(current_app.config['SUGGESTIONS_PER_USER'])
     return render_template('account.html', title='Account',
-                           image=image_file, form=form)
+                           image=image_file, form=form, suggestions=suggestions)
 
 
 @users.route("/user/<string:username>")
@@ -85,7 +117,37 @@ def user_posts(username):
     posts = Post.query \
         .filter_by(author=user).order_by(desc(Post.date_posted)) \
         .paginate(page=page, per_page=2)
-    return render_template("user_posts.html", posts=posts, user=user)
+    suggestions = []
+    if current_user.is_authenticated:
+        suggestions = current_user.suggested(current_app.config['SUGGESTIONS_PER_USER'])
+    return render_template("user_posts.html", posts=posts, user=user,
+                           suggestions=suggestions)
+
+
+@users.route("/user/<string:username>/follow", methods=['post'])
+@login_required
+def follow(username):
+    user = User.query.filter_by(username=username).first_or_404()
+    if user == current_user:
+        flash('You cannot follow yourself.', 'warning')
+        return redirect(url_for('users.user_posts', username=username))
+    current_user.follow(user)
+    # the suggestion has been taken, no need to keep offering it
+    Suggestion.query.filter_by(user_id=current_user.id,
+                               suggested_id=user.id).delete()
+    db.session.commit()
+    flash(f'You are now following {username}.', 'success')
+    return redirect(url_for('users.user_posts', username=username))
+
+
+@users.route("/user/<string:username>/unfollow", methods=['post'])
+@login_required
+def unfollow(username):
+    user = User.query.filter_by(username=username).first_or_404()
+    current_user.unfollow(user)
+    db.session.commit()
+    flash(f'You are no longer following {username}.', 'info')
+    return redirect(url_for('users.user_posts', username=username))
 
 
 @users.route("/reset_password", methods=['get', 'post'])